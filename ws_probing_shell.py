@@ -8,21 +8,228 @@ import cmd
 import argparse
 import json
 import hashlib
+import sqlite3
+import math
+import re
+import bisect
+import random
+import selectors
+import statistics
+import threading
+import cProfile
+import pstats
+import io
+import contextlib
+from collections import Counter
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler
+from http.server import HTTPServer
 from string import Template
-from collections import OrderedDict
 from urllib.parse import unquote
 import colorama
 from termcolor import colored
 from websocket import create_connection
 from websocket import WebSocketConnectionClosedException
 from websocket import WebSocketException
+from websocket import WebSocketTimeoutException
+from websocket import ABNF
 from tabulate import tabulate
 
 
+class CampaignMetrics(object):
+    """
+    Counters and response time histogram of the exchanges sent by the shell commands, exposed in OpenMetrics text format
+    over a local HTTP port and/or as periodic JSON lines snapshots written in a file
+    """
+    # Upper bounds in seconds of the response time histogram buckets
+    BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+
+    def __init__(self):
+        """
+        Constructor
+        """
+        # Lock protecting the values below because commands can send messages from several threads
+        self.__lock = threading.Lock()
+        # Values by command name (label of every metric)
+        # KEY is the command name and the VALUE is a dict for which:
+        #   Value associated with Key named "MESSAGES" is the number of messages sent
+        #   Value associated with Key named "ERRORS" is the number of messages for which a WS error occur
+        #   Value associated with Key named "REQUEST_BYTES" is the number of bytes sent
+        #   Value associated with Key named "RESPONSE_BYTES" is the number of bytes received
+        #   Value associated with Key named "FRAMES" is the number of frames received
+        #   Value associated with Key named "UNANSWERED" is the number of messages sent without WS error but without any frame received
+        #   Value associated with Key named "BUCKETS" is the count of response times for each bucket (not cumulative, last one is +Inf)
+        #   Value associated with Key named "RESPONSE_TIME_SUM" is the sum of the response times in seconds
+        # Only the messages for which at least a frame has been received without WS error have a response time
+        self.__values = {}
+        self.__http_server = None
+        self.__snapshot_stop_event = None
+        self.__snapshot_thread = None
+
+    def record_exchange(self, command, response_time, request_bytes, response_bytes, frame_count, is_error):
+        """
+        Update the metrics with a exchange
+
+        The response time of a exchange without any frame received is the delay waited for nothing, so it is not added to the histogram.
+
+        :param command: Name of the command that has sent the message
+        :param response_time: Response time in seconds
+        :param request_bytes: Number of bytes sent in request
+        :param response_bytes: Number of bytes received in response
+        :param frame_count: Number of frames received in response
+        :param is_error: Flag to indicate if the request meet WS error
+        """
+        with self.__lock:
+            if command not in self.__values:
+                self.__values[command] = {"MESSAGES": 0, "ERRORS": 0, "REQUEST_BYTES": 0, "RESPONSE_BYTES": 0, "FRAMES": 0, "UNANSWERED": 0,
+                                          "BUCKETS": [0] * (len(self.BUCKETS) + 1), "RESPONSE_TIME_SUM": 0.0}
+            values = self.__values[command]
+            values["MESSAGES"] += 1
+            values["REQUEST_BYTES"] += request_bytes
+            values["RESPONSE_BYTES"] += response_bytes
+            values["FRAMES"] += frame_count
+            if is_error:
+                values["ERRORS"] += 1
+            elif frame_count == 0:
+                values["UNANSWERED"] += 1
+            else:
+                values["BUCKETS"][bisect.bisect_left(self.BUCKETS, response_time)] += 1
+                values["RESPONSE_TIME_SUM"] += response_time
+
+    def snapshot(self):
+        """
+        Take a copy of the current metrics
+
+        :return: A dict with the metrics of each command
+        """
+        with self.__lock:
+            return {command: dict(values, BUCKETS=list(values["BUCKETS"])) for command, values in self.__values.items()}
+
+    def render_openmetrics(self):
+        """
+        Render the current metrics in OpenMetrics text format
+
+        :return: The metrics exposition text
+        """
+        metrics = self.snapshot()
+        counters = [("ws_probing_messages", "MESSAGES", "Messages sent to the WS server."),
+                    ("ws_probing_errors", "ERRORS", "Messages for which a WS error occur."),
+                    ("ws_probing_request_bytes", "REQUEST_BYTES", "Bytes sent to the WS server."),
+                    ("ws_probing_response_bytes", "RESPONSE_BYTES", "Bytes received from the WS server."),
+                    ("ws_probing_frames", "FRAMES", "Frames received from the WS server."),
+                    ("ws_probing_unanswered", "UNANSWERED", "Messages sent without WS error for which no frame has been received.")]
+        lines = []
+        for name, key, description in counters:
+            lines.append("# TYPE %s counter" % name)
+            lines.append("# HELP %s %s" % (name, description))
+            for command in sorted(metrics):
+                lines.append('%s_total{command="%s"} %s' % (name, command, metrics[command][key]))
+        name = "ws_probing_response_time_seconds"
+        lines.append("# TYPE %s histogram" % name)
+        lines.append("# UNIT %s seconds" % name)
+        lines.append("# HELP %s Response time of the messages answered without error." % name)
+        for command in sorted(metrics):
+            cumulative_count = 0
+            for bound, count in zip(self.BUCKETS + ["+Inf"], metrics[command]["BUCKETS"]):
+                cumulative_count += count
+                lines.append('%s_bucket{command="%s",le="%s"} %s' % (name, command, bound, cumulative_count))
+            lines.append('%s_count{command="%s"} %s' % (name, command, cumulative_count))
+            lines.append('%s_sum{command="%s"} %s' % (name, command, metrics[command]["RESPONSE_TIME_SUM"]))
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def start_http_exporter(self, port):
+        """
+        Serve the metrics in OpenMetrics text format on the "/metrics" path of a local HTTP port from a background thread
+
+        :param port: Port on which the HTTP server listen on the loopback interface
+        """
+        metrics = self
+
+        class MetricsRequestHandler(BaseHTTPRequestHandler):
+            """
+            HTTP request handler serving the metrics exposition
+            """
+
+            def do_GET(self):
+                """
+                Send the metrics exposition for the "/metrics" path and a 404 error for any other path
+                """
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                content = metrics.render_openmetrics().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/openmetrics-text; version=1.0.0; charset=utf-8")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, message_format, *args):
+                """
+                Do not print the scrapes in the shell
+
+                :param message_format: Format of the log message
+                :param args: Values of the log message
+                """
+                pass
+
+        self.stop_http_exporter()
+        self.__http_server = HTTPServer(("127.0.0.1", port), MetricsRequestHandler)
+        threading.Thread(target=self.__http_server.serve_forever, daemon=True).start()
+
+    def stop_http_exporter(self):
+        """
+        Stop the HTTP server serving the metrics if it is running
+        """
+        if self.__http_server is not None:
+            self.__http_server.shutdown()
+            self.__http_server.server_close()
+            self.__http_server = None
+
+    def start_snapshot_exporter(self, filename, interval):
+        """
+        Append a JSON line with the current metrics to a file at a fixed interval from a background thread
+
+        :param filename: Destination file
+        :param interval: Interval in seconds between two snapshots
+        """
+        self.stop_snapshot_exporter()
+        stop_event = threading.Event()
+
+        def write_snapshots():
+            while True:
+                # A last snapshot is written when the writing is stopped
+                stopped = stop_event.wait(interval)
+                line = json.dumps({"TIMESTAMP": time.time(), "METRICS": self.snapshot()}, sort_keys=True)
+                with open(filename, "a") as snapshot_file:
+                    snapshot_file.write(line + "\n")
+                if stopped:
+                    break
+
+        self.__snapshot_stop_event = stop_event
+        self.__snapshot_thread = threading.Thread(target=write_snapshots, daemon=True)
+        self.__snapshot_thread.start()
+
+    def stop_snapshot_exporter(self):
+        """
+        Stop the writing of the snapshots if it is running, once the last snapshot is written
+        """
+        if self.__snapshot_stop_event is not None:
+            self.__snapshot_stop_event.set()
+            self.__snapshot_thread.join()
+            self.__snapshot_stop_event = None
+            self.__snapshot_thread = None
+
+
 class WSProbingShell(cmd.Cmd):
     """
     Interactive shell in order to probe/analyze a WebSocket endpoint
     """
+    # Pattern of the response content indicating that a request has been throttled by the WS server
+    THROTTLING_PATTERN = re.compile(r"rate.?limit|too many|throttl|slow down|quota|\b429\b", re.IGNORECASE)
+
     def __init__(self):
         """
         Constructor
@@ -38,9 +245,54 @@ class WSProbingShell(cmd.Cmd):
         #   Value associated with Key named "REQUEST_LENGTH" is the length of the request sent
         #   Value associated with Key named "RESPONSE_LENGTH" is the length of the response received
         #   Value associated with Key named "IS_ERROR" is a flag to indicate if the request meet WS error during sending
+        #   Value associated with Key named "FRAME_COUNT" is the number of frames received in response
+        #   Value associated with Key named "RESPONSE_BYTES" is the number of bytes received in response (frames payloads)
         self.__exchanges = {}
         # Save connection parameters in order to reopen connection later in case of need
         self.__client_connection_parameters = None
+        # SQLite database in which exchanges of every run are stored in order to query them later
+        # Database is kept in memory until the "database" command is used to bind it to a file
+        self.__database = None
+        # Identifier of the last run stored in the database (used as default run by analysis commands)
+        self.__last_run_id = None
+        self.__open_database(":memory:")
+        # Metrics of the exchanges sent by the commands, see "metrics" command
+        self.__metrics = CampaignMetrics()
+        # Profiler wrapping the commands execution while profiling is enabled, see "profile" command
+        self.__profiler = None
+        self.__profiling_enabled = False
+        # Profilers of the functions executed by worker threads while profiling is enabled, as a profiler only see the thread enabling it
+        self.__workers_profilers = []
+        self.__workers_profilers_lock = threading.Lock()
+        # Timing spans measured while profiling is enabled
+        # KEY is the path of the span (tuple of the names of the enclosing spans and of the span) and the VALUE is a list with
+        # the number of calls, the total time and the self time (total time minus the time spent in the nested spans) in seconds
+        self.__spans = {}
+        # Spans currently opened, each one being a list with the name, the start time and the time spent in the nested spans
+        self.__spans_stack = []
+
+    def onecmd(self, line):
+        """
+        Execute a command under the profiler when profiling is enabled
+
+        Invalid arguments make argparse exit after printing the usage, this exit is ignored in order to not lose the
+        connection and the exchanges stored in memory.
+
+        :param line: Command line
+        :return: Flag to indicate if the shell must be exited
+        """
+        try:
+            command = self.parseline(line)[0]
+            if not self.__profiling_enabled or command is None or command == "profile":
+                return super(WSProbingShell, self).onecmd(line)
+            with self.__span(command):
+                self.__profiler.enable()
+                try:
+                    return super(WSProbingShell, self).onecmd(line)
+                finally:
+                    self.__profiler.disable()
+        except SystemExit:
+            return False
 
     def do_connect(self, line):
         """
@@ -103,20 +355,26 @@ class WSProbingShell(cmd.Cmd):
         Replay a specified message a specified number of times
 
         Syntax:
-        replay -m [path_to_message_file] -n [repetition_count]
+        replay -m [path_to_message_file] -n [repetition_count] -w [idle_window] -t [response_timeout]
 
-        Example:
+        Examples:
         replay -m /tmp/message.txt -n 20
+        replay -m /tmp/message.txt -n 20 -w 2000
+        replay -m /tmp/message.txt -n 20 -w 200 -t 30000
 
         Parameters:
         path_to_message_file: Path to the file (text format) containing the message to replay, no space in path.
         repetition_count: Number of time that the message must be send
+        idle_window: Delay in milliseconds without any frame received after which the response to a message is considered as complete (default to 500)
+        response_timeout: Delay in milliseconds to wait for the first frame of the response after which the message is considered as meeting an error (default to 10000)
         """
         try:
             # Define parser for command line arguments
             parser = argparse.ArgumentParser()
             parser.add_argument('-m', action="store", dest="path_to_message_file")
             parser.add_argument('-n', action="store", dest="repetition_count", type=int)
+            parser.add_argument('-w', action="store", dest="idle_window", type=int, default=500)
+            parser.add_argument('-t', action="store", dest="response_timeout", type=int, default=10000)
             # Handle empty argument and mandatory arguments case
             if line.strip() == "" or "-m" not in line or "-n" not in line:
                 print(colored("[!] Missing parameters !", "yellow", attrs=[]))
@@ -129,16 +387,22 @@ class WSProbingShell(cmd.Cmd):
                     message = m_file.read()
                 print(colored("[*] Message readed.", "cyan", attrs=[]))
                 # Check if connection is still available
-                self.__check_connection_availability()
+                with self.__span("check_connection"):
+                    self.__check_connection_availability(args.idle_window / 1000.0)
                 # Build the list of messages to send
-                messages_list = [message] * args.repetition_count
+                with self.__span("build_messages"):
+                    messages_list = [message] * args.repetition_count
                 # Send message(s)
                 self.__exchanges.clear()
-                self.__send_messages(messages_list)
+                self.__send_messages(messages_list, args.idle_window / 1000.0, args.response_timeout / 1000.0, "replay")
                 # Save exchanges data to a local file
                 filename = "exchanges_replay.json"
-                print(colored("[*] Exchanges saved to file '%s'." % filename, "cyan", attrs=[]))
-                self.__store_exchanges_to_file(filename)
+                with self.__span("store"):
+                    print(colored("[*] Exchanges saved to file '%s'." % filename, "cyan", attrs=[]))
+                    self.__store_exchanges_to_file(filename)
+                    # Save exchanges data to the database
+                    run_id = self.__store_exchanges_to_database("replay")
+                print(colored("[*] Exchanges saved to database as run %s." % run_id, "cyan", attrs=[]))
                 print(colored("[*] Use commands 'analyze' or 'search' to run a analysis on the exchanges data in order to spot interesting elements.", "cyan", attrs=[]))
         except Exception as error:
             print(colored("[!] Replay failed: %s" % error, "red", attrs=[]))
@@ -148,10 +412,12 @@ class WSProbingShell(cmd.Cmd):
         Send fuzzing message based on a message template and a set of files containing payloads for each positions in the template message
 
         Syntax:
-        fuzz -m [path_to_template_message_file] -p [path_to_payload_message_file_1] [path_to_payload_message_file_x]
+        fuzz -m [path_to_template_message_file] -p [path_to_payload_message_file_1] [path_to_payload_message_file_x] -w [idle_window] -t [response_timeout]
 
-        Example:
+        Examples:
         fuzz -m /tmp/message_template.txt -p /tmp/message_payload_1.txt /tmp/message_payload_2.txt
+        fuzz -m /tmp/message_template.txt -w 2000 -p /tmp/message_payload_1.txt /tmp/message_payload_2.txt
+        fuzz -m /tmp/message_template.txt -w 200 -t 30000 -p /tmp/message_payload_1.txt /tmp/message_payload_2.txt
 
         Message template example:
         Hello $payload_1 from $payload_2 !
@@ -162,12 +428,16 @@ class WSProbingShell(cmd.Cmd):
                                        Use $payload_1 for payload coming from payload file 1 and so on...
                                        Use $$ to escape the $ character if your original text need to contains a $.
         path_to_payload_message_file_x: Path to the file (text format) containing the payload (one by line) to use for the current position (x here), no space in path.
+        idle_window: Delay in milliseconds without any frame received after which the response to a message is considered as complete (default to 500)
+        response_timeout: Delay in milliseconds to wait for the first frame of the response after which the message is considered as meeting an error (default to 10000)
         """
         try:
             # Define parser for command line arguments
             parser = argparse.ArgumentParser()
             parser.add_argument('-m', action="store", dest="path_to_template_message_file")
             parser.add_argument('-p', action="store", dest="payload_files", nargs="+")
+            parser.add_argument('-w', action="store", dest="idle_window", type=int, default=500)
+            parser.add_argument('-t', action="store", dest="response_timeout", type=int, default=10000)
             # Handle empty argument and mandatory arguments case
             if line.strip() == "" or "-m" not in line or "-p" not in line:
                 print(colored("[!] Missing parameters !", "yellow", attrs=[]))
@@ -180,126 +450,181 @@ class WSProbingShell(cmd.Cmd):
                     message_template = m_file.read()
                 print(colored("[*] Message template readed.", "cyan", attrs=[]))
                 # Check if connection is still available
-                self.__check_connection_availability()
+                with self.__span("check_connection"):
+                    self.__check_connection_availability(args.idle_window / 1000.0)
                 # Build the list of messages to send
-                print(colored("[*] Build the list of messages to send...", "cyan", attrs=[]))
-                # -- Build a list of all payloads combinations with their placeholders
-                payload_files_copy = args.payload_files[:]
-                payloads = self.__build_fuzzing_dicts(payload_files_list=payload_files_copy, payload_combinations=[], current_position=1)
-                # -- Build messages list
-                message_template_object = Template(message_template)
-                messages_list = []
-                for payload_dict in payloads:
-                    messages_list.append(message_template_object.safe_substitute(payload_dict))
+                with self.__span("build_messages"):
+                    print(colored("[*] Build the list of messages to send...", "cyan", attrs=[]))
+                    # -- Build a list of all payloads combinations with their placeholders
+                    payload_files_copy = args.payload_files[:]
+                    payloads = self.__build_fuzzing_dicts(payload_files_list=payload_files_copy, payload_combinations=[], current_position=1)
+                    # -- Build messages list
+                    message_template_object = Template(message_template)
+                    messages_list = []
+                    for payload_dict in payloads:
+                        messages_list.append(message_template_object.safe_substitute(payload_dict))
                 print(colored("[*] List of messages built (%s messages)." % len(messages_list), "cyan", attrs=[]))
                 # Send message(s)
                 self.__exchanges.clear()
-                self.__send_messages(messages_list)
+                self.__send_messages(messages_list, args.idle_window / 1000.0, args.response_timeout / 1000.0, "fuzz")
                 # Save exchanges data to a local file
                 filename = "exchanges_fuzzing.json"
-                print(colored("[*] Exchanges saved to file '%s'." % filename, "cyan", attrs=[]))
-                self.__store_exchanges_to_file(filename)
+                with self.__span("store"):
+                    print(colored("[*] Exchanges saved to file '%s'." % filename, "cyan", attrs=[]))
+                    self.__store_exchanges_to_file(filename)
+                    # Save exchanges data to the database
+                    run_id = self.__store_exchanges_to_database("fuzz")
+                print(colored("[*] Exchanges saved to database as run %s." % run_id, "cyan", attrs=[]))
                 print(colored("[*] Use commands 'analyze' or 'search' to run a analysis on the exchanges data in order to spot interesting elements.", "cyan", attrs=[]))
         except Exception as error:
             print(colored("[!] Fuzzing failed: %s" % error, "red", attrs=[]))
 
     def do_analyze(self, line):
         """
-        Run a analysis on the exchanges data in order to spot interesting elements and print them (no parameter required).
+        Run a analysis on the exchanges data in order to spot interesting elements and print them.
+
+        Syntax:
+        analyze
+        analyze -r [run_id]
+
+        Examples:
+        analyze
+        analyze -r 2
+
+        Parameters:
+        run_id: Identifier of the run to analyze (see "database" command), last run is used if not specified
 
         TODO: Add more analysis cases on exchanges !
         """
-        if len(self.__exchanges) == 0:
-            print(colored("[!] No exchanges available !", "yellow", attrs=[]))
-        else:
-            # Shortcuts
-            exchanges = self.__exchanges
-            total = len(exchanges)
-            data_to_print = []
-            exchanges_gathered = {}
-            # 1) We analyze the exchanges response time by aggregate them on integer rounding time of the reponse time and sorting the aggregation result
-            # Gather informations
-            data_to_print.clear()
-            exchanges_gathered.clear()
-            for idx in range(0, total):
-                response_time = int(exchanges[idx]["RESPONSE_TIME"])
-                if response_time not in exchanges_gathered:
-                    exchanges_gathered[response_time] = ""
-                exchanges_gathered[response_time] += " " + str(idx)
-            for k in OrderedDict(exchanges_gathered):
-                data_to_print.append([k, exchanges_gathered[k].strip()])
-            # Print result
-            print(colored("[*] Exchanges aggregated by response time:", "cyan", attrs=[]))
-            print(tabulate(headers=["Delay in seconds", "Exchange ID(s)"], tabular_data=data_to_print, tablefmt="grid", numalign="right", stralign="right"))
-            # 2) We analyze the exchanges response in order to aggregate them for which the reponse is identical (same content)
-            # Gather informations
-            data_to_print.clear()
-            exchanges_gathered.clear()
-            for idx in range(0, total):
-                response_identifier = hashlib.sha256(exchanges[idx]["RESPONSE"].encode("utf-8")).hexdigest()
-                if response_identifier not in exchanges_gathered:
-                    exchanges_gathered[response_identifier] = ""
-                exchanges_gathered[response_identifier] += " " + str(idx)
-            for k in exchanges_gathered:
-                data_to_print.append([k, exchanges_gathered[k].strip()])
-            # Print result
-            print(colored("[*] Exchanges aggregated with identical response content:", "cyan", attrs=[]))
-            print(tabulate(headers=["Response content digest (sha256 in hex)", "Exchange ID(s)"], tabular_data=data_to_print, tablefmt="grid", numalign="right", stralign="right"))
+        try:
+            # Define parser for command line arguments
+            parser = argparse.ArgumentParser()
+            parser.add_argument('-r', action="store", dest="run_id", type=int, default=None)
+            # Parse command line
+            args = parser.parse_args(line.split(" ") if line.strip() != "" else [])
+            run_id = self.__last_run_id if args.run_id is None else args.run_id
+            if self.__count_exchanges(run_id) == 0:
+                print(colored("[!] No exchanges available !", "yellow", attrs=[]))
+            else:
+                with self.__span("analyze"):
+                    # 1) We analyze the exchanges response time by aggregate them on integer rounding time of the reponse time and sorting the aggregation result
+                    # Gather informations
+                    cursor = self.__database.execute("SELECT CAST(response_time AS INTEGER) AS delay, GROUP_CONCAT(exchange_id, ' ') FROM "
+                                                     "(SELECT exchange_id, response_time FROM exchanges WHERE run_id = ? ORDER BY exchange_id) "
+                                                     "GROUP BY delay ORDER BY delay", (run_id,))
+                    data_to_print = [[row[0], row[1]] for row in cursor]
+                    # Print result
+                    print(colored("[*] Exchanges aggregated by response time:", "cyan", attrs=[]))
+                    print(tabulate(headers=["Delay in seconds", "Exchange ID(s)"], tabular_data=data_to_print, tablefmt="grid", numalign="right", stralign="right"))
+                    # 2) We analyze the exchanges response in order to aggregate them for which the reponse is identical (same content)
+                    # Gather informations
+                    cursor = self.__database.execute("SELECT fingerprint, GROUP_CONCAT(exchange_id, ' ') FROM "
+                                                     "(SELECT exchange_id, fingerprint FROM exchanges WHERE run_id = ? ORDER BY exchange_id) "
+                                                     "GROUP BY fingerprint ORDER BY MIN(exchange_id)", (run_id,))
+                    data_to_print = [[row[0], row[1]] for row in cursor]
+                    # Print result
+                    print(colored("[*] Exchanges aggregated with identical response content:", "cyan", attrs=[]))
+                    print(tabulate(headers=["Response content digest (sha256 in hex)", "Exchange ID(s)"], tabular_data=data_to_print, tablefmt="grid", numalign="right", stralign="right"))
+        except Exception as error:
+            print(colored("[!] Analyze failed: %s" % error, "red", attrs=[]))
 
     def do_show(self, line):
         """
-        Show the details of specified exchanges or all if not exchange id is provided
+        Show the details of specified exchanges or, page by page, all the exchanges of a run if not exchange id is provided
 
         ID start at zero
 
         Syntax:
         show
         show -e [exchange_id_1] [exchange_id_x]
+        show -r [run_id] -s [sort_field] -d -x -f [fingerprint] -n [page_size] -p [page_number]
 
         Examples:
         show
         show -e 0
         show -e 0 1 2
+        show -p 2
+        show -s latency -d -n 10
+        show -r 1 -x
+        show -f 5d41402abc4b2a76
 
         Parameters:
         exchange_id_x: Exchange identifier (number)
+        run_id: Identifier of the run to show (see "database" command), last run is used if not specified
+        sort_field: Field used to sort the exchanges, one of "id" (default), "latency", "length", "error" or "frames"
+        fingerprint: Only show exchanges for which the response content digest (see "analyze" command) start with this value
+        page_size: Number of exchanges displayed per page (default to 20)
+        page_number: Page to display, start at 1 (default to 1)
+
+        Option "-d" is used to sort in descending order
+        Option "-x" is used to only show exchanges that meet an error
         """
         try:
             # Define parser for command line arguments
             parser = argparse.ArgumentParser()
             parser.add_argument('-e', action="store", dest="exchange_ids", nargs="+", default=[])
-            if len(self.__exchanges) == 0:
+            parser.add_argument('-r', action="store", dest="run_id", type=int, default=None)
+            parser.add_argument('-s', action="store", dest="sort_field", default="id", choices=["id", "latency", "length", "error", "frames"])
+            parser.add_argument('-d', action="store_true", dest="descending")
+            parser.add_argument('-x', action="store_true", dest="errors_only")
+            parser.add_argument('-f', action="store", dest="fingerprint", default=None)
+            parser.add_argument('-n', action="store", dest="page_size", type=int, default=20)
+            parser.add_argument('-p', action="store", dest="page_number", type=int, default=1)
+            # Parse command line
+            args = parser.parse_args(line.split(" ") if line.strip() != "" else [])
+            run_id = self.__last_run_id if args.run_id is None else args.run_id
+            if self.__count_exchanges(run_id) == 0:
                 print(colored("[!] No exchanges available !", "yellow", attrs=[]))
             else:
-                # Parse command line
-                args = None
-                if "-e" in line:
-                    args = parser.parse_args(line.split(" "))
-                # Build the list of exchange ids to display
-                if args is None or args.exchange_ids is None or len(args.exchange_ids) == 0:
-                    ids = sorted(self.__exchanges.keys())
+                columns = "exchange_id, request, response, response_time, request_length, response_length, is_error, frame_count"
+                # Build the query retrieving the exchanges to display
+                if len(args.exchange_ids) > 0:
+                    ids = [int(eid) for eid in args.exchange_ids]
+                    cursor = self.__database.execute("SELECT %s FROM exchanges WHERE run_id = ? AND exchange_id IN (%s)" % (columns, ",".join("?" * len(ids))), [run_id] + ids)
+                    rows_by_id = {row[0]: row for row in cursor}
+                    rows = []
+                    for eid in ids:
+                        if eid not in rows_by_id:
+                            print(colored("[!] Exchange ID %s do not exists !" % eid, "yellow", attrs=[]))
+                            continue
+                        rows.append(rows_by_id[eid])
+                    page_info = None
                 else:
-                    ids = args.exchange_ids
+                    if args.page_size <= 0 or args.page_number <= 0:
+                        print(colored("[!] Page size and page number must be greater than zero !", "yellow", attrs=[]))
+                        return
+                    sort_columns = {"id": "exchange_id", "latency": "response_time", "length": "response_length", "error": "is_error", "frames": "frame_count"}
+                    where_clause = "run_id = ?"
+                    parameters = [run_id]
+                    if args.errors_only:
+                        where_clause += " AND is_error = 1"
+                    if args.fingerprint is not None:
+                        where_clause += " AND fingerprint LIKE ?"
+                        parameters.append(args.fingerprint.lower() + "%")
+                    total = self.__database.execute("SELECT COUNT(*) FROM exchanges WHERE %s" % where_clause, parameters).fetchone()[0]
+                    order = "DESC" if args.descending else "ASC"
+                    cursor = self.__database.execute("SELECT %s FROM exchanges WHERE %s ORDER BY %s %s, exchange_id %s LIMIT ? OFFSET ?" % (columns, where_clause, sort_columns[args.sort_field], order, order),
+                                                     parameters + [args.page_size, (args.page_number - 1) * args.page_size])
+                    rows = cursor.fetchall()
+                    page_info = (args.page_number, max(1, (total + args.page_size - 1) // args.page_size), total)
                 # Build the list of data to print
                 data_to_print = []
-                for eid in ids:
-                    eid_int = int(eid)
-                    if eid_int not in self.__exchanges:
-                        print(colored("[!] Exchange ID %s do not exists !" % eid, "yellow", attrs=[]))
-                        continue
-                    exchange = self.__exchanges[int(eid)]
+                for row in rows:
+                    eid, request, response, response_time, request_length, response_length, is_error, frame_count = row
                     # Add infos for REQUEST
-                    fields = [eid, "REQUEST", "-", "-", exchange["REQUEST_LENGTH"], exchange["REQUEST"]]
+                    fields = [eid, "REQUEST", "-", "-", "-", request_length, request]
                     data_to_print.append(fields)
                     # Add infos for RESPONSE
-                    if exchange["IS_ERROR"]:
+                    if is_error:
                         error_occur = "Yes"
                     else:
                         error_occur = "No"
-                    fields = [eid, "RESPONSE", error_occur, exchange["RESPONSE_TIME"], exchange["RESPONSE_LENGTH"], exchange["RESPONSE"]]
+                    fields = [eid, "RESPONSE", error_occur, response_time, frame_count, response_length, response]
                     data_to_print.append(fields)
                 # Print result
-                print(tabulate(headers=["Exchange ID", "Message type", "Error occur?", "Response delay in seconds", "Length", "Content"], tabular_data=data_to_print, tablefmt="grid", numalign="right", stralign="right"))
+                print(tabulate(headers=["Exchange ID", "Message type", "Error occur?", "Response delay in seconds", "Frames", "Length", "Content"], tabular_data=data_to_print, tablefmt="grid", numalign="right", stralign="right"))
+                if page_info is not None:
+                    print(colored("[*] Page %s/%s (%s exchanges matching), use option '-p' to display another page." % page_info, "cyan", attrs=[]))
         except Exception as error:
             print(colored("[!] Show failed: %s" % error, "red", attrs=[]))
 
@@ -367,16 +692,19 @@ class WSProbingShell(cmd.Cmd):
         Syntax:
         search -w [word_1] [word_x]
         search -i -w [word_1] [word_x]
+        search -r [run_id] -w [word_1] [word_x]
 
         Examples:
         search -w test123 SQLException
         search -i -w test123 SQLException
         search -i -w OutOfMemory
         search -i -w hello%20world
+        search -r 2 -w SQLException
 
         Parameters:
         word_x: Word to search in exchanges responses collection
                 Use %20 to encode a space in word that need to contains a space
+        run_id: Identifier of the run in which the search is performed (see "database" command), last run is used if not specified
 
         Option "-i" is used to perform a case insensitive research
         """
@@ -385,29 +713,29 @@ class WSProbingShell(cmd.Cmd):
             parser = argparse.ArgumentParser()
             parser.add_argument('-w', action="store", dest="words", nargs="+")
             parser.add_argument('-i', action="store_true", dest="case_insensitive")
+            parser.add_argument('-r', action="store", dest="run_id", type=int, default=None)
             # Handle empty argument and mandatory arguments case
             if line.strip() == "" or "-w" not in line:
                 print(colored("[!] Missing parameters !", "yellow", attrs=[]))
             else:
-                if len(self.__exchanges) == 0:
+                # Parse command line
+                args = parser.parse_args(line.split(" "))
+                run_id = self.__last_run_id if args.run_id is None else args.run_id
+                if self.__count_exchanges(run_id) == 0:
                     print(colored("[!] No exchanges available !", "yellow", attrs=[]))
                 else:
-                    # Parse command line
-                    args = parser.parse_args(line.split(" "))
                     # Perform search
                     found = {}
-                    for idx in range(0, len(self.__exchanges)):
-                        resp = self.__exchanges[idx]["RESPONSE"]
+                    for word in args.words:
+                        searched_word = unquote(word)
                         if args.case_insensitive:
-                            resp = resp.lower()
-                        for word in args.words:
-                            searched_word = unquote(word)
-                            if args.case_insensitive:
-                                searched_word = searched_word.lower()
-                            if searched_word in resp:
-                                if word not in found:
-                                    found[word] = ""
-                                found[word] += " " + str(idx)
+                            query = "SELECT exchange_id FROM exchanges WHERE run_id = ? AND INSTR(UNICODE_LOWER(response), ?) > 0 ORDER BY exchange_id"
+                            searched_word = searched_word.lower()
+                        else:
+                            query = "SELECT exchange_id FROM exchanges WHERE run_id = ? AND INSTR(response, ?) > 0 ORDER BY exchange_id"
+                        ids = [str(row[0]) for row in self.__database.execute(query, (run_id, searched_word))]
+                        if len(ids) > 0:
+                            found[word] = " ".join(ids)
                     # Save exchanges search to a local file
                     filename = "exchanges_searching.json"
                     print(colored("[*] Exchanges search saved to file '%s'." % filename, "cyan", attrs=[]))
@@ -421,11 +749,107 @@ class WSProbingShell(cmd.Cmd):
         except Exception as error:
             print(colored("[!] Search failed: %s" % error, "red", attrs=[]))
 
+    def do_timing(self, line):
+        """
+        Probe the WS server for timing side channels by sending several candidate payloads many times and ranking them
+        according to the statistical difference of their response time with the response time of a baseline candidate
+
+        Samples are collected by rounds, each round send every candidate once in a random order in order to cancel
+        the drift of the server response time, and rounds are spread over a pool of connections.
+
+        Syntax:
+        timing -m [path_to_template_message_file] -p [path_to_candidates_file] -n [samples_count] -c [connections_count]
+
+        Example:
+        timing -m /tmp/message_template.txt -p /tmp/users.txt -n 200 -c 4
+
+        Message template example:
+        {"action": "login", "user": "$payload_1", "password": "x"}
+
+        Parameters:
+        path_to_template_message_file: Path to the file (text format) containing the template of the message, no space in path.
+                                       Use $payload_1 as placeholder for the candidate (same syntax than for the "fuzz" command).
+        path_to_candidates_file: Path to the file (text format) containing the candidates (one by line) to compare, no space in path.
+                                 The first candidate is the baseline (for example a user known to not exist) to which the others are compared.
+        samples_count: Number of time that each candidate must be send (default to 100)
+        connections_count: Number of connections used to send the messages (default to 1)
+
+        Note: Perform a initial connection using the "connect" command before to use this command in order to allow
+        this command to know the connection context to use.
+        """
+        try:
+            # Define parser for command line arguments
+            parser = argparse.ArgumentParser()
+            parser.add_argument('-m', action="store", dest="path_to_template_message_file")
+            parser.add_argument('-p', action="store", dest="path_to_candidates_file")
+            parser.add_argument('-n', action="store", dest="samples_count", type=int, default=100)
+            parser.add_argument('-c', action="store", dest="connections_count", type=int, default=1)
+            # Handle empty argument and mandatory arguments case
+            if line.strip() == "" or "-m" not in line or "-p" not in line:
+                print(colored("[!] Missing parameters !", "yellow", attrs=[]))
+            elif self.__client_connection_parameters is None:
+                print(colored("[!] Perform a initial connection using the 'connect' command !", "yellow", attrs=[]))
+            else:
+                # Parse command line
+                args = parser.parse_args(line.split(" "))
+                if args.samples_count < 2 or args.connections_count < 1:
+                    print(colored("[!] At least 2 samples and 1 connection are required !", "yellow", attrs=[]))
+                    return
+                # Build the list of messages to send
+                with open(args.path_to_template_message_file, "r") as m_file:
+                    message_template_object = Template(m_file.read())
+                with open(args.path_to_candidates_file, "r") as c_file:
+                    candidates = [candidate.rstrip('\n') for candidate in c_file.readlines()]
+                if len(candidates) < 2:
+                    print(colored("[!] At least 2 candidates are required !", "yellow", attrs=[]))
+                    return
+                with self.__span("build_messages"):
+                    messages_list = [message_template_object.safe_substitute({"payload_1": candidate}) for candidate in candidates]
+                # Spread the rounds over the connections pool and collect the samples
+                rounds_by_connection = [len(range(idx, args.samples_count, args.connections_count)) for idx in range(args.connections_count)]
+                print(colored("[*] Send %s samples (%s candidates x %s rounds)..." % (len(candidates) * args.samples_count, len(candidates), args.samples_count), "cyan", attrs=[]))
+                start = time.perf_counter()
+                with self.__span("send"):
+                    with ThreadPoolExecutor(max_workers=args.connections_count) as executor:
+                        futures = [executor.submit(self.__run_profiled, self.__collect_timing_samples, messages_list, rounds_count) for rounds_count in rounds_by_connection]
+                        workers_samples = [future.result() for future in futures]
+                elapsed = time.perf_counter() - start
+                # Merge the samples of every connection
+                samples = [[] for _ in candidates]
+                errors = [0] * len(candidates)
+                for worker_samples, worker_errors in workers_samples:
+                    for idx in range(len(candidates)):
+                        samples[idx].extend(worker_samples[idx])
+                        errors[idx] += worker_errors[idx]
+                collected = sum(len(candidate_samples) for candidate_samples in samples)
+                print(colored("[*] %s samples collected in %.2f seconds (%.0f msg/s, %s errors)." % (collected, elapsed, collected / elapsed, sum(errors)), "cyan", attrs=[]))
+                # Rank the candidates
+                with self.__span("analyze"):
+                    results = self.__rank_timing_samples(candidates, samples, errors)
+                filename = "timing_analysis.json"
+                print(colored("[*] Timing analysis saved to file '%s'." % filename, "cyan", attrs=[]))
+                self.__store_data_to_file(results, filename)
+                # Print result
+                data_to_print = []
+                for rank, result in enumerate(results):
+                    fields = [rank if rank > 0 else "Baseline", result["CANDIDATE"], result["SAMPLES"], result["ERRORS"], "-", "-", "-", "-", "-", "-"]
+                    if result["MEDIAN_MS"] is not None:
+                        fields[4:6] = ["%.3f" % result["MEDIAN_MS"], "%.3f" % result["TRIMMED_MEAN_MS"]]
+                    if result["Z_SCORE"] is not None:
+                        significant = "Yes" if result["SIGNIFICANT"] else "No"
+                        fields[6:] = ["%+.3f" % result["MEDIAN_DELTA_MS"], "%.2f" % result["Z_SCORE"], "%.2e" % result["P_VALUE"], significant]
+                    data_to_print.append(fields)
+                print(colored("[*] Candidates ranked by difference of response time with the baseline candidate (Mann-Whitney U test):", "cyan", attrs=[]))
+                print(tabulate(headers=["Rank", "Candidate", "Samples", "Errors", "Median in ms", "Trimmed mean in ms", "Median delta in ms", "Z score", "P value", "Significant?"],
+                               tabular_data=data_to_print, tablefmt="grid", numalign="right", stralign="right"))
+        except Exception as error:
+            print(colored("[!] Timing probing failed: %s" % error, "red", attrs=[]))
+
     def do_probe_request_length_limit(self, line):
         """
         Probe the WS server in order to determine the maximum length allowed for a request.
 
-        Note: This command can also be used to identify if a request frequence limiter is in place on WS server.
+        Note: Use the "probe_request_rate_limit" command to identify if a request frequence limiter is in place on WS server.
         """
         try:
             # Check if connection is still available
@@ -452,6 +876,134 @@ class WSProbingShell(cmd.Cmd):
         except Exception as error:
             print(colored("[!] Probing failed: %s" % error, "red", attrs=[]))
 
+    def do_probe_request_rate_limit(self, line):
+        """
+        Probe the WS server in order to determine if a request frequence limiter is in place and the maximum sustainable request rate.
+
+        A small message is sent at increasing rates, one step per rate, each message being scheduled at a precise time and the
+        messages of a step being spread over the connections. Messages are sent without waiting for the response to the previous
+        ones, the responses being matched with the messages in the order in which they have been sent. Probing stop at the first step
+        for which throttling responses, errors, timeouts, disconnections or a response time inflation is detected, or when the client
+        cannot send the messages at the target rate (this last case is not a limitation of the WS server).
+
+        Syntax:
+        probe_request_rate_limit -m [path_to_message_file] -r [rates] -d [step_duration] -c [connections_count] -t [response_timeout]
+
+        Examples:
+        probe_request_rate_limit
+        probe_request_rate_limit -r 1,2,5,10,20,50,100,200 -d 10 -c 4
+        probe_request_rate_limit -m /tmp/message.txt -t 2
+
+        Parameters:
+        path_to_message_file: Path to the file (text format) containing the message to send, no space in path (default to "hello" message).
+        rates: Rates in messages per second to test in increasing order (default to 1,2,5,10,20,50,100)
+        step_duration: Duration in seconds of each step (default to 5)
+        connections_count: Number of connections over which the messages are spread (default to 1)
+        response_timeout: Delay in seconds after which a message without response is considered as timed out (default to 5),
+                          the connection is then reopened for the next messages
+
+        Note: Perform a initial connection using the "connect" command before to use this command in order to allow
+        this command to know the connection context to use.
+        """
+        try:
+            # Define parser for command line arguments
+            parser = argparse.ArgumentParser()
+            parser.add_argument('-m', action="store", dest="path_to_message_file", default=None)
+            parser.add_argument('-r', action="store", dest="rates", default="1,2,5,10,20,50,100")
+            parser.add_argument('-d', action="store", dest="step_duration", type=float, default=5)
+            parser.add_argument('-c', action="store", dest="connections_count", type=int, default=1)
+            parser.add_argument('-t', action="store", dest="response_timeout", type=float, default=5)
+            # Check if connection context is defined
+            if self.__client_connection_parameters is None:
+                print(colored("[!] Perform a initial connection using the 'connect' command !", "yellow", attrs=[]))
+                return
+            # Parse command line
+            args = parser.parse_args(line.split(" ") if line.strip() != "" else [])
+            try:
+                rates = [float(rate) for rate in args.rates.split(",")]
+            except ValueError:
+                rates = []
+            if len(rates) == 0 or rates[0] <= 0 or any(rates[idx] >= rates[idx + 1] for idx in range(len(rates) - 1)):
+                print(colored("[!] Rates must be positive numbers in increasing order !", "yellow", attrs=[]))
+                return
+            if args.step_duration <= 0 or args.connections_count <= 0 or args.response_timeout <= 0:
+                print(colored("[!] Step duration, connections count and response timeout must be greater than zero !", "yellow", attrs=[]))
+                return
+            message = "hello"
+            if args.path_to_message_file is not None:
+                with open(args.path_to_message_file, "r") as m_file:
+                    message = m_file.read()
+            # Perform probing step by step
+            print(colored("[*] Open a pool of %s connections..." % args.connections_count, "cyan", attrs=[]))
+            connections = []
+            steps = []
+            try:
+                for _ in range(args.connections_count):
+                    connections.append(self.__create_connection_from_context())
+                    connections[-1].settimeout(args.response_timeout)
+                baseline_median = None
+                for rate in rates:
+                    print(colored("[*]    Send messages at %s msg/s during %s seconds..." % (rate, args.step_duration), "cyan", attrs=[]))
+                    # Schedule the messages of the step and spread them over the connections
+                    messages_count = max(1, int(round(rate * args.step_duration)))
+                    step_start = time.perf_counter() + 0.1
+                    schedule = [step_start + idx / rate for idx in range(messages_count)]
+                    with self.__span("send"):
+                        with ThreadPoolExecutor(max_workers=args.connections_count) as executor:
+                            futures = [executor.submit(self.__run_profiled, self.__send_scheduled_messages, connections[idx], message, schedule[idx::args.connections_count], args.response_timeout)
+                                       for idx in range(args.connections_count)]
+                    # Get back the connections of every worker before to report a failure so that all of them are released
+                    results = []
+                    worker_error = None
+                    for idx, future in enumerate(futures):
+                        try:
+                            worker_results, connections[idx] = future.result()
+                            results.extend(worker_results)
+                        except Exception as error:
+                            worker_error = error
+                    if worker_error is not None:
+                        raise worker_error
+                    # Compute the statistics of the step
+                    with self.__span("analyze"):
+                        step = self.__summarize_rate_step(rate, results, baseline_median)
+                    if baseline_median is None:
+                        baseline_median = step["LATENCY_MS"]["P50"]
+                    steps.append(step)
+                    print(colored("[*]    %s messages sent at %.1f msg/s: %s." % (step["SENT"], step["ACHIEVED_RATE"], step["STATUS"]), "cyan", attrs=[]))
+                    if step["STATUS"] != "OK":
+                        break
+            finally:
+                # Release connections to free the server and avoid DOS
+                for connection in connections:
+                    if connection is not None:
+                        try:
+                            connection.close()
+                        except (WebSocketException, IOError):
+                            pass
+            # Save probing data to a local file
+            filename = "probe_rate_limit.json"
+            print(colored("[*] Probing data saved to file '%s'." % filename, "cyan", attrs=[]))
+            self.__store_data_to_file(steps, filename)
+            # Print result
+            data_to_print = []
+            for step in steps:
+                latencies = step["LATENCY_MS"]
+                latencies_fields = ["-"] * 4 if latencies["P50"] is None else ["%.2f" % latencies[key] for key in ["P50", "P90", "P99", "MAX"]]
+                data_to_print.append([step["TARGET_RATE"], step["SENT"], "%.1f" % step["ACHIEVED_RATE"], step["THROTTLED"], step["TIMEOUTS"], step["ERRORS"], step["DISCONNECTIONS"]] + latencies_fields + [step["STATUS"]])
+            print(tabulate(headers=["Target msg/s", "Sent", "Achieved msg/s", "Throttled", "Timeouts", "Errors", "Disconnections", "P50 in ms", "P90 in ms", "P99 in ms", "Max in ms", "Status"],
+                           tabular_data=data_to_print, tablefmt="grid", numalign="right", stralign="right"))
+            sustainable_steps = [step for step in steps if step["STATUS"] == "OK"]
+            if steps[-1]["STATUS"] == "RATE NOT REACHED":
+                print(colored("[!] Rate limitation NOT identified, the client cannot send messages at %s msg/s (%.1f msg/s reached)." % (steps[-1]["TARGET_RATE"], steps[-1]["ACHIEVED_RATE"]), "yellow", attrs=[]))
+            elif len(sustainable_steps) == 0:
+                print(colored("[!] Rate limitation detected from the lowest rate tested (%s msg/s) !" % steps[0]["TARGET_RATE"], "yellow", attrs=[]))
+            elif len(sustainable_steps) == len(steps):
+                print(colored("[!] Rate limitation NOT identified BUT sustainable throughput ceiling is superior to %.1f msg/s." % sustainable_steps[-1]["ACHIEVED_RATE"], "yellow", attrs=[]))
+            else:
+                print(colored("[*] Rate limitation identified at %s msg/s (%s), sustainable throughput ceiling is %.1f msg/s." % (steps[-1]["TARGET_RATE"], steps[-1]["STATUS"], sustainable_steps[-1]["ACHIEVED_RATE"]), "cyan", attrs=[]))
+        except Exception as error:
+            print(colored("[!] Probing failed: %s" % error, "red", attrs=[]))
+
     def do_probe_connection_channels_supported(self, line):
         """
         Probe the WS server in order to determine if it support the secure or insecure channel connection using the following behavior:
@@ -572,6 +1124,182 @@ class WSProbingShell(cmd.Cmd):
         except Exception as error:
             print(colored("[!] Probing failed: %s" % error, "red", attrs=[]))
 
+    def do_database(self, line):
+        """
+        Bind the exchanges database to a file in order to keep the exchanges of every run across sessions
+        or list the runs stored in the current database if no file is provided
+
+        Syntax:
+        database
+        database -f [path_to_database_file]
+
+        Examples:
+        database
+        database -f /tmp/session.db
+
+        Parameters:
+        path_to_database_file: Path to the SQLite database file to use (created if it do not exists), no space in path.
+                               Runs stored previously in the file are immediately available to the analysis commands.
+                               Runs of the current session not yet stored in a file are copied to the file (with new identifiers
+                               if the file already contains runs).
+        """
+        try:
+            # Define parser for command line arguments
+            parser = argparse.ArgumentParser()
+            parser.add_argument('-f', action="store", dest="path_to_database_file", default=None)
+            # Parse command line
+            args = parser.parse_args(line.split(" ") if line.strip() != "" else [])
+            if args.path_to_database_file is not None:
+                copied_runs_count = self.__open_database(args.path_to_database_file)
+                print(colored("[*] Database bound to file '%s'." % args.path_to_database_file, "cyan", attrs=[]))
+                if copied_runs_count > 0:
+                    print(colored("[*] %s runs of the current session copied to the file." % copied_runs_count, "cyan", attrs=[]))
+            # Print the runs stored
+            cursor = self.__database.execute("SELECT run_id, command, started_at, exchange_count FROM runs ORDER BY run_id")
+            data_to_print = [list(row) for row in cursor]
+            if len(data_to_print) == 0:
+                print(colored("[!] No runs available !", "yellow", attrs=[]))
+            else:
+                print(colored("[*] Runs stored (last run is %s):" % self.__last_run_id, "cyan", attrs=[]))
+                print(tabulate(headers=["Run ID", "Command", "Start date", "Exchanges count"], tabular_data=data_to_print, tablefmt="grid", numalign="right", stralign="right"))
+        except Exception as error:
+            print(colored("[!] Database operation failed: %s" % error, "red", attrs=[]))
+
+    def do_metrics(self, line):
+        """
+        Export the metrics (messages, errors, bytes, frames and response time histogram) of the exchanges sent by the commands
+        while they are running or print them if no exporter is specified
+
+        Syntax:
+        metrics
+        metrics -p [port]
+        metrics -f [path_to_snapshot_file] -i [interval]
+        metrics -s
+
+        Examples:
+        metrics
+        metrics -p 9464
+        metrics -f /tmp/metrics.jsonl -i 5
+        metrics -p 9464 -f /tmp/metrics.jsonl
+
+        Parameters:
+        port: Local port on which the metrics are served in OpenMetrics text format (path "/metrics") for a Prometheus scraper
+        path_to_snapshot_file: Path to the file to which a JSON line with the metrics is appended at each interval, no space in path.
+        interval: Interval in seconds between two snapshots (default to 10)
+
+        Option "-s" is used to stop the exporters
+        """
+        try:
+            # Define parser for command line arguments
+            parser = argparse.ArgumentParser()
+            parser.add_argument('-p', action="store", dest="port", type=int, default=None)
+            parser.add_argument('-f', action="store", dest="path_to_snapshot_file", default=None)
+            parser.add_argument('-i', action="store", dest="interval", type=float, default=10)
+            parser.add_argument('-s', action="store_true", dest="stop")
+            # Parse command line
+            args = parser.parse_args(line.split(" ") if line.strip() != "" else [])
+            if args.stop:
+                self.__metrics.stop_http_exporter()
+                self.__metrics.stop_snapshot_exporter()
+                print(colored("[*] Metrics exporters stopped.", "cyan", attrs=[]))
+            elif args.port is not None or args.path_to_snapshot_file is not None:
+                if args.port is not None:
+                    self.__metrics.start_http_exporter(args.port)
+                    print(colored("[*] Metrics served on 'http://127.0.0.1:%s/metrics'." % args.port, "cyan", attrs=[]))
+                if args.path_to_snapshot_file is not None:
+                    self.__metrics.start_snapshot_exporter(args.path_to_snapshot_file, args.interval)
+                    print(colored("[*] Metrics appended to file '%s' every %s seconds." % (args.path_to_snapshot_file, args.interval), "cyan", attrs=[]))
+            else:
+                metrics = self.__metrics.snapshot()
+                if len(metrics) == 0:
+                    print(colored("[!] No metrics available !", "yellow", attrs=[]))
+                else:
+                    data_to_print = []
+                    for command in sorted(metrics):
+                        values = metrics[command]
+                        answered_count = sum(values["BUCKETS"])
+                        average = "%.4f" % (values["RESPONSE_TIME_SUM"] / answered_count) if answered_count > 0 else "-"
+                        data_to_print.append([command, values["MESSAGES"], values["ERRORS"], values["UNANSWERED"], values["REQUEST_BYTES"], values["RESPONSE_BYTES"], values["FRAMES"], average])
+                    print(tabulate(headers=["Command", "Messages", "Errors", "Without response", "Request bytes", "Response bytes", "Frames", "Average response delay in seconds"],
+                                   tabular_data=data_to_print, tablefmt="grid", numalign="right", stralign="right"))
+        except Exception as error:
+            print(colored("[!] Metrics operation failed: %s" % error, "red", attrs=[]))
+
+    def do_profile(self, line):
+        """
+        Profile the execution of the commands in order to identify where the time is spent
+
+        Commands are executed under cProfile and the main stages (build_messages, check_connection, send, recv, store, analyze)
+        are measured by timing spans nested in a span named after the command. The functions executed by the worker threads of
+        the "timing" and "probe_request_rate_limit" commands are profiled separately and added to the functions statistics, their
+        time being measured by the "send" span of the command.
+
+        Syntax:
+        profile on
+        profile off
+        profile dump -f [output_files_prefix] -n [functions_count]
+
+        Examples:
+        profile on
+        profile dump
+        profile dump -f /tmp/fuzz_campaign -n 40
+
+        Parameters:
+        output_files_prefix: Prefix of the files generated (default to "profile"), no space in path:
+                             [prefix].pstats contains the cProfile statistics (readable with the pstats module, snakeviz, gprof2dot...)
+                             [prefix].collapsed contains the timing spans in collapsed stack format (in microseconds) to render as flame graph
+        functions_count: Number of functions printed in the summary sorted by cumulative time (default to 25)
+
+        Action "on" start a new profiling session, "off" stop it and "dump" print and save the data of the current session.
+        """
+        try:
+            # Define parser for command line arguments
+            parser = argparse.ArgumentParser()
+            parser.add_argument('action', action="store", choices=["on", "off", "dump"])
+            parser.add_argument('-f', action="store", dest="output_files_prefix", default="profile")
+            parser.add_argument('-n', action="store", dest="functions_count", type=int, default=25)
+            # Handle empty argument and mandatory arguments case
+            if line.strip() == "":
+                print(colored("[!] Missing parameters !", "yellow", attrs=[]))
+                return
+            # Parse command line
+            args = parser.parse_args(line.split(" "))
+            if args.action == "on":
+                self.__profiler = cProfile.Profile()
+                self.__spans.clear()
+                with self.__workers_profilers_lock:
+                    self.__workers_profilers.clear()
+                self.__profiling_enabled = True
+                print(colored("[*] Profiling enabled.", "cyan", attrs=[]))
+            elif args.action == "off":
+                self.__profiling_enabled = False
+                print(colored("[*] Profiling disabled.", "cyan", attrs=[]))
+            elif self.__profiler is None:
+                print(colored("[!] No profiling data available !", "yellow", attrs=[]))
+            else:
+                # Print and save the functions statistics
+                stream = io.StringIO()
+                stats = pstats.Stats(self.__profiler, stream=stream)
+                with self.__workers_profilers_lock:
+                    for profiler in self.__workers_profilers:
+                        stats.add(profiler)
+                stats.sort_stats("cumulative").print_stats(args.functions_count)
+                stats.dump_stats(args.output_files_prefix + ".pstats")
+                print(colored("[*] Functions sorted by cumulative time:", "cyan", attrs=[]))
+                print(stream.getvalue().strip("\n"))
+                # Print and save the timing spans
+                data_to_print = []
+                for path, values in sorted(self.__spans.items(), key=lambda item: item[1][1], reverse=True):
+                    data_to_print.append([";".join(path), values[0], "%.4f" % values[1], "%.4f" % values[2]])
+                print(colored("[*] Timing spans sorted by total time:", "cyan", attrs=[]))
+                print(tabulate(headers=["Span", "Calls", "Total time in seconds", "Self time in seconds"], tabular_data=data_to_print, tablefmt="grid", numalign="right", stralign="right"))
+                with open(args.output_files_prefix + ".collapsed", "w") as collapsed_file:
+                    for path, values in sorted(self.__spans.items()):
+                        collapsed_file.write("%s %d\n" % (";".join(path), round(values[2] * 1000000)))
+                print(colored("[*] Profiling data saved to files '%s.pstats' and '%s.collapsed'." % (args.output_files_prefix, args.output_files_prefix), "cyan", attrs=[]))
+        except Exception as error:
+            print(colored("[!] Profiling operation failed: %s" % error, "red", attrs=[]))
+
     def do_disconnect(self, line):
         """
         Close the current WS connection (no parameter required)
@@ -589,8 +1317,67 @@ class WSProbingShell(cmd.Cmd):
         Exit the shell (no parameter required)
         """
         self.do_disconnect(line)
+        self.__metrics.stop_http_exporter()
+        self.__metrics.stop_snapshot_exporter()
         return True
 
+    def do_EOF(self, line):
+        """
+        Exit the shell when the end of the input is reached, for example when the commands are piped to the shell (no parameter required)
+        """
+        print("")
+        return self.do_quit(line)
+
+    @contextlib.contextmanager
+    def __span(self, name):
+        """
+        Measure the time spent in a stage of a command when profiling is enabled
+
+        Spans must only be opened from the thread running the shell.
+
+        :param name: Name of the stage
+        """
+        if not self.__profiling_enabled:
+            yield
+            return
+        span = [name, time.perf_counter(), 0.0]
+        self.__spans_stack.append(span)
+        try:
+            yield
+        finally:
+            self.__spans_stack.pop()
+            elapsed = time.perf_counter() - span[1]
+            path = tuple(opened_span[0] for opened_span in self.__spans_stack) + (name,)
+            values = self.__spans.setdefault(path, [0, 0.0, 0.0])
+            values[0] += 1
+            values[1] += elapsed
+            values[2] += elapsed - span[2]
+            if len(self.__spans_stack) > 0:
+                self.__spans_stack[-1][2] += elapsed
+
+    def __run_profiled(self, function, *args):
+        """
+        Execute a function from a worker thread under a dedicated profiler when profiling is enabled
+
+        :param function: Function to execute
+        :param args: Arguments of the function
+        :return: The value returned by the function
+        """
+        if not self.__profiling_enabled:
+            return function(*args)
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Since Python 3.12 only one profiler can be active and it already see every thread
+            return function(*args)
+        try:
+            return function(*args)
+        finally:
+            profiler.disable()
+            with self.__workers_profilers_lock:
+                self.__workers_profilers.append(profiler)
+
     def __store_exchanges_to_file(self, filename):
         """
         Save the exchange internal store dict to a JSON pretty printed string in a text file
@@ -612,48 +1399,542 @@ class WSProbingShell(cmd.Cmd):
         with open(filename, "w") as ex_file:
             ex_file.write(formatted_data)
 
-    def __send_messages(self, messages_list):
+    def __open_database(self, location):
+        """
+        Open the exchanges database and create its schema if needed
+
+        The runs of the current database are copied to the new one when the current database is kept in memory
+        in order to not lose them, they get new identifiers if the new database already contains runs.
+
+        :param location: Path to the SQLite database file or ":memory:" for a in memory database
+        :return: The number of runs copied from the previous database
+        """
+        database = sqlite3.connect(location)
+        # Case insensitive search rely on the Python lowering that handle non ASCII characters unlike the SQLite one
+        database.create_function("UNICODE_LOWER", 1, lambda value: value.lower() if isinstance(value, str) else value)
+        database.execute("CREATE TABLE IF NOT EXISTS runs (run_id INTEGER PRIMARY KEY AUTOINCREMENT, command TEXT NOT NULL, "
+                         "started_at TEXT NOT NULL, exchange_count INTEGER NOT NULL)")
+        database.execute("CREATE TABLE IF NOT EXISTS exchanges (run_id INTEGER NOT NULL REFERENCES runs (run_id), exchange_id INTEGER NOT NULL, "
+                         "request TEXT, response TEXT, response_time REAL, request_length INTEGER, response_length INTEGER, "
+                         "is_error INTEGER NOT NULL, fingerprint TEXT, frame_count INTEGER, response_bytes INTEGER, PRIMARY KEY (run_id, exchange_id))")
+        for column in ["response_time", "response_length", "is_error", "fingerprint", "frame_count"]:
+            database.execute("CREATE INDEX IF NOT EXISTS exchanges_%s_idx ON exchanges (run_id, %s)" % (column, column))
+        database.commit()
+        copied_runs_count = 0
+        if self.__database is not None:
+            # File of a in memory database is empty in the list of the databases
+            if self.__database.execute("PRAGMA database_list").fetchone()[2] == "":
+                runs = self.__database.execute("SELECT run_id, command, started_at, exchange_count FROM runs ORDER BY run_id").fetchall()
+                for run_id, command, started_at, exchange_count in runs:
+                    cursor = database.execute("INSERT INTO runs (command, started_at, exchange_count) VALUES (?, ?, ?)", (command, started_at, exchange_count))
+                    rows = self.__database.execute("SELECT ?, exchange_id, request, response, response_time, request_length, response_length, is_error, "
+                                                   "fingerprint, frame_count, response_bytes FROM exchanges WHERE run_id = ?", (cursor.lastrowid, run_id))
+                    database.executemany("INSERT INTO exchanges (run_id, exchange_id, request, response, response_time, request_length, response_length, "
+                                         "is_error, fingerprint, frame_count, response_bytes) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+                database.commit()
+                copied_runs_count = len(runs)
+            self.__database.close()
+        self.__database = database
+        self.__last_run_id = database.execute("SELECT MAX(run_id) FROM runs").fetchone()[0]
+        return copied_runs_count
+
+    def __store_exchanges_to_database(self, command):
+        """
+        Save the exchange internal store dict to the database as a new run
+
+        :param command: Name of the command that has generated the exchanges
+        :return: The identifier of the run created
+        """
+        cursor = self.__database.execute("INSERT INTO runs (command, started_at, exchange_count) VALUES (?, ?, ?)",
+                                         (command, time.strftime("%Y-%m-%d %H:%M:%S"), len(self.__exchanges)))
+        run_id = cursor.lastrowid
+        rows = []
+        for idx, exchange in self.__exchanges.items():
+            fingerprint = hashlib.sha256(exchange["RESPONSE"].encode("utf-8")).hexdigest()
+            rows.append((run_id, idx, exchange["REQUEST"], exchange["RESPONSE"], exchange["RESPONSE_TIME"], exchange["REQUEST_LENGTH"],
+                         exchange["RESPONSE_LENGTH"], 1 if exchange["IS_ERROR"] else 0, fingerprint, exchange["FRAME_COUNT"], exchange["RESPONSE_BYTES"]))
+        self.__database.executemany("INSERT INTO exchanges (run_id, exchange_id, request, response, response_time, request_length, response_length, "
+                                    "is_error, fingerprint, frame_count, response_bytes) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        self.__database.commit()
+        self.__last_run_id = run_id
+        return run_id
+
+    def __count_exchanges(self, run_id):
+        """
+        Count the exchanges stored in the database for a run
+
+        :param run_id: Identifier of the run
+        :return: The number of exchanges of the run (zero if the run do not exists)
+        """
+        if run_id is None:
+            return 0
+        return self.__database.execute("SELECT COUNT(*) FROM exchanges WHERE run_id = ?", (run_id,)).fetchone()[0]
+
+    def __create_connection_from_context(self):
+        """
+        Open a new WS connection using the connection context saved by the "connect" command
+
+        :return: The connection opened
+        """
+        # Define parser for command line arguments stored in the connection context (same like for "connect" command)
+        parser = argparse.ArgumentParser()
+        parser.add_argument('-t', action="store", dest="endpoint")
+        parser.add_argument('-o', action="store", dest="origin", default=None)
+        parser.add_argument('-e', action="store", dest="extra_http_headers", default=None)
+        parser.add_argument('-p', action="store", dest="subprotocols", default=None)
+        # Parse command line stored in the connection context (same like for "connect" command)
+        args = parser.parse_args(self.__client_connection_parameters.split(" "))
+        # Build custom headers map
+        extra_headers = {}
+        if args.extra_http_headers is not None:
+            for pair in args.extra_http_headers.split("§"):
+                parts = pair.split("=")
+                extra_headers[parts[0]] = parts[1]
+        # Build subprotocols list
+        subprotocols_set = []
+        if args.subprotocols is not None:
+            for subprotocol in args.subprotocols.split("§"):
+                subprotocols_set.append(subprotocol)
+        return create_connection(url=args.endpoint, timeout=10, header=extra_headers, origin=args.origin, subprotocols=subprotocols_set)
+
+    def __collect_timing_samples(self, messages_list, rounds_count):
+        """
+        Send every message once per round, in a random order for each round, on a dedicated connection and measure the response time of each exchange
+
+        The response time is the delay until the first frame of the response, the frames received after it are discarded before the next message.
+
+        :param messages_list: List of messages (one by candidate)
+        :param rounds_count: Number of rounds to perform
+        :return: A tuple with the list of response times in seconds of each candidate and the list of errors count of each candidate
+                 (exchanges not performed because the connection cannot be reopened are counted as errors)
+        """
+        samples = [[] for _ in messages_list]
+        errors = [0] * len(messages_list)
+        order = list(range(len(messages_list)))
+        messages_bytes = [message.encode("utf-8") for message in messages_list]
+        randomizer = random.Random()
+        connection = None
+        try:
+            connection = self.__open_warmed_up_connection(messages_list[0])
+            for _ in range(rounds_count):
+                randomizer.shuffle(order)
+                for idx in order:
+                    start = time.perf_counter()
+                    try:
+                        # Discard the frames of the previous response received after its first frame
+                        self.__drain_frames(connection)
+                        if not connection.connected:
+                            connection = self.__open_warmed_up_connection(messages_list[0])
+                        start = time.perf_counter()
+                        connection.send(messages_list[idx])
+                        frames, response_time = self.__receive_frames(connection, 0, connection.gettimeout(), max_frames=1)
+                        if len(frames) == 0:
+                            raise WebSocketTimeoutException("No response received within %s seconds" % connection.gettimeout())
+                        samples[idx].append(response_time)
+                        self.__metrics.record_exchange("timing", response_time, len(messages_bytes[idx]), len(frames[0]), 1, False)
+                    except (WebSocketException, IOError):
+                        errors[idx] += 1
+                        self.__metrics.record_exchange("timing", time.perf_counter() - start, len(messages_bytes[idx]), 0, 0, True)
+                        connection.close()
+                        connection = None
+                        connection = self.__open_warmed_up_connection(messages_list[0])
+        except (WebSocketException, IOError) as error:
+            # The connection cannot be (re)opened, count the exchanges not performed as errors and keep the samples already collected
+            print(colored("[!]    Connection lost (%s), remaining rounds of the connection counted as errors." % error, "yellow", attrs=[]))
+            for idx in range(len(messages_list)):
+                errors[idx] = rounds_count - len(samples[idx])
+        finally:
+            if connection is not None:
+                connection.close()
+        return samples, errors
+
+    def __open_warmed_up_connection(self, message):
+        """
+        Open a new WS connection using the connection context and send a first message on it so that the first measured exchange is not penalized
+
+        :param message: Message used to warm up the connection
+        :return: The connection opened
+        """
+        connection = self.__create_connection_from_context()
+        try:
+            connection.send(message)
+            self.__receive_frames(connection, 0, connection.gettimeout(), max_frames=1)
+        except BaseException:
+            connection.close()
+            raise
+        return connection
+
+    def __rank_timing_samples(self, candidates, samples, errors):
+        """
+        Compare the response times of each candidate with the response times of the baseline candidate (first one) using
+        a Mann-Whitney U test and rank the candidates from the most to the less different
+
+        :param candidates: List of candidates, the first one being the baseline
+        :param samples: List of response times in seconds of each candidate
+        :param errors: List of errors count of each candidate
+        :return: A list of dict with the statistics of each candidate, baseline first then others sorted by decreasing absolute Z score
+        """
+        baseline_samples = sorted(samples[0])
+        baseline_count = len(baseline_samples)
+        results = []
+        for idx, candidate in enumerate(candidates):
+            result = {"CANDIDATE": candidate, "SAMPLES": len(samples[idx]), "ERRORS": errors[idx], "MEDIAN_MS": None, "TRIMMED_MEAN_MS": None,
+                      "MEDIAN_DELTA_MS": None, "Z_SCORE": None, "P_VALUE": None, "SIGNIFICANT": False}
+            candidate_samples = sorted(samples[idx])
+            count = len(candidate_samples)
+            if count > 0:
+                trim = int(count * 0.1)
+                result["MEDIAN_MS"] = statistics.median(candidate_samples) * 1000
+                result["TRIMMED_MEAN_MS"] = statistics.mean(candidate_samples[trim:count - trim]) * 1000
+            if idx > 0 and count > 0 and baseline_count > 0:
+                # U statistic: number of pairs for which the candidate sample is slower than the baseline sample (ties count for half)
+                u_statistic = 0.0
+                for latency in candidate_samples:
+                    lower = bisect.bisect_left(baseline_samples, latency)
+                    u_statistic += lower + (bisect.bisect_right(baseline_samples, latency, lower) - lower) / 2.0
+                # Normal approximation with correction for ties
+                total = count + baseline_count
+                ties_term = sum(tie_count ** 3 - tie_count for tie_count in Counter(candidate_samples + baseline_samples).values())
+                sigma = math.sqrt(count * baseline_count / 12.0 * ((total + 1) - ties_term / (total * (total - 1))))
+                z_score = (u_statistic - count * baseline_count / 2.0) / sigma if sigma > 0 else 0.0
+                result["MEDIAN_DELTA_MS"] = result["MEDIAN_MS"] - statistics.median(baseline_samples) * 1000
+                result["Z_SCORE"] = z_score
+                result["P_VALUE"] = math.erfc(abs(z_score) / math.sqrt(2))
+                # Bonferroni correction because every candidate is tested against the baseline
+                result["SIGNIFICANT"] = result["P_VALUE"] < 0.05 / (len(candidates) - 1)
+            results.append(result)
+        results[1:] = sorted(results[1:], key=lambda result: -1 if result["Z_SCORE"] is None else abs(result["Z_SCORE"]), reverse=True)
+        return results
+
+    def __send_scheduled_messages(self, connection, message, schedule, response_timeout):
+        """
+        Send a message at each scheduled time on a connection without waiting for the responses, a reader thread matching the frames
+        received with the messages waiting for a response in the order in which they have been sent
+
+        The WS server is expected to reply to each message with a single frame. When a message is not answered within the response timeout
+        or when the connection fail, the messages still waiting for a response are marked as failed and the connection is released so that
+        a late response cannot be matched with a next message, a new connection being opened for the next messages.
+
+        :param connection: WS connection to use or None to open a new one using the connection context
+        :param message: Message to send
+        :param schedule: List of times (time.perf_counter() clock) at which the message must be send
+        :param response_timeout: Delay in seconds after which a message without response is considered as timed out
+        :return: A tuple with the list of dict describing each exchange and the connection to use for the next messages (None if it has been closed)
+        """
+        results = []
+        message_bytes = len(message.encode("utf-8"))
+        lock = threading.Lock()
+        sending_done = threading.Event()
+        readers = []
+        waiting = None
+        try:
+            for scheduled_time in schedule:
+                delay = scheduled_time - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                result = {"START": time.perf_counter(), "STATUS": None, "RESPONSE_TIME": None}
+                results.append(result)
+                try:
+                    if connection is None or not connection.connected:
+                        # The connection has been released by the reader thread after a failure
+                        if connection is not None:
+                            connection.close()
+                        connection = None
+                        connection = self.__create_connection_from_context()
+                        connection.settimeout(response_timeout)
+                    if len(readers) == 0 or readers[-1][0] is not connection:
+                        waiting = deque()
+                        reader = threading.Thread(target=self.__run_profiled, args=(self.__match_scheduled_responses, connection, waiting, lock, sending_done, response_timeout, message_bytes))
+                        reader.start()
+                        readers.append((connection, reader))
+                    result["START"] = time.perf_counter()
+                    with lock:
+                        waiting.append(result)
+                    connection.send(message)
+                except (WebSocketException, IOError) as error:
+                    with lock:
+                        if waiting is not None and result in waiting:
+                            waiting.remove(result)
+                        # The reader thread can have already marked the message as failed
+                        if result["STATUS"] is None:
+                            result["STATUS"] = "DISCONNECTION" if isinstance(error, (WebSocketConnectionClosedException, ConnectionError)) else "ERROR"
+                            self.__metrics.record_exchange("probe_request_rate_limit", time.perf_counter() - result["START"], message_bytes, 0, 0, True)
+                    if connection is not None:
+                        connection.shutdown()
+        except BaseException:
+            # The caller do not get the connection back in this case so release it here
+            if connection is not None:
+                connection.shutdown()
+                connection = None
+            raise
+        finally:
+            # Wait for the responses to the messages sent
+            sending_done.set()
+            for _, reader in readers:
+                reader.join()
+        if connection is not None and not connection.connected:
+            connection.close()
+            connection = None
+        return results, connection
+
+    def __match_scheduled_responses(self, connection, waiting, lock, sending_done, response_timeout, message_bytes):
+        """
+        Receive the frames of a connection and match each one with the oldest message waiting for a response, until all messages are sent
+        and answered or until the connection fail (see "__send_scheduled_messages")
+
+        :param connection: WS connection on which the frames are received
+        :param waiting: Queue of the dict describing the exchanges waiting for a response, in the order in which the messages have been sent
+        :param lock: Lock protecting the queue and the dict describing the exchanges
+        :param sending_done: Event set when all the messages have been sent
+        :param response_timeout: Delay in seconds after which a message without response is considered as timed out
+        :param message_bytes: Number of bytes of the message sent
+        """
+        failure_status = "ERROR"
+        try:
+            with selectors.DefaultSelector() as selector:
+                selector.register(connection.sock, selectors.EVENT_READ)
+                while True:
+                    with lock:
+                        if len(waiting) == 0 and sending_done.is_set():
+                            failure_status = None
+                            break
+                        oldest_start = waiting[0]["START"] if len(waiting) > 0 else None
+                    if not connection.connected:
+                        failure_status = "DISCONNECTION"
+                        break
+                    # Wake up regularly to see the messages sent meanwhile and the end of the sending
+                    timeout = 0.05
+                    if oldest_start is not None:
+                        timeout = min(timeout, oldest_start + response_timeout - time.perf_counter())
+                        if timeout <= 0:
+                            failure_status = "TIMEOUT"
+                            break
+                    # Data already decrypted by the SSL layer are not visible to the selector
+                    pending = getattr(connection.sock, "pending", None)
+                    if (pending is None or pending() == 0) and len(selector.select(timeout)) == 0:
+                        continue
+                    try:
+                        opcode, data = connection.recv_data(control_frame=True)
+                    except (WebSocketConnectionClosedException, ConnectionError):
+                        failure_status = "DISCONNECTION"
+                        break
+                    except WebSocketTimeoutException:
+                        failure_status = "TIMEOUT"
+                        break
+                    received = time.perf_counter()
+                    if opcode == ABNF.OPCODE_CLOSE:
+                        failure_status = "DISCONNECTION"
+                        break
+                    if opcode in (ABNF.OPCODE_PING, ABNF.OPCODE_PONG):
+                        continue
+                    with lock:
+                        # Frames sent by the server without being asked are ignored
+                        if len(waiting) == 0:
+                            continue
+                        result = waiting.popleft()
+                        result["RESPONSE_TIME"] = received - result["START"]
+                        if self.THROTTLING_PATTERN.search(data.decode("utf-8", "replace")) is not None:
+                            result["STATUS"] = "THROTTLED"
+                        else:
+                            result["STATUS"] = "OK"
+                    self.__metrics.record_exchange("probe_request_rate_limit", result["RESPONSE_TIME"], message_bytes, len(data), 1, False)
+        finally:
+            if failure_status is not None:
+                # Release the connection so that a late response cannot be matched with a next message
+                connection.shutdown()
+                with lock:
+                    while len(waiting) > 0:
+                        result = waiting.popleft()
+                        result["STATUS"] = failure_status
+                        self.__metrics.record_exchange("probe_request_rate_limit", time.perf_counter() - result["START"], message_bytes, 0, 0, True)
+
+    def __summarize_rate_step(self, rate, results, baseline_median):
+        """
+        Compute the statistics of a step of the rate limit probing and determine if the rate is sustainable
+
+        :param rate: Target rate in messages per second of the step
+        :param results: List of dict describing each exchange of the step
+        :param baseline_median: Median response time in milliseconds of the first step (None for the first step)
+        :return: A dict with the statistics of the step
+        """
+        statuses = Counter(result["STATUS"] for result in results)
+        latencies = sorted(result["RESPONSE_TIME"] * 1000 for result in results if result["RESPONSE_TIME"] is not None)
+        starts = sorted(result["START"] for result in results)
+        # Rate at which the messages have really been sent (messages are late when the client cannot keep up with the schedule)
+        achieved_rate = (len(starts) - 1) / (starts[-1] - starts[0]) if len(starts) > 1 and starts[-1] > starts[0] else rate
+        step = {"TARGET_RATE": rate, "SENT": len(results), "ACHIEVED_RATE": achieved_rate, "THROTTLED": statuses["THROTTLED"], "TIMEOUTS": statuses["TIMEOUT"],
+                "ERRORS": statuses["ERROR"], "DISCONNECTIONS": statuses["DISCONNECTION"], "LATENCY_MS": {"P50": None, "P90": None, "P99": None, "MAX": None}}
+        if len(latencies) > 0:
+            for key, quantile in [("P50", 0.5), ("P90", 0.9), ("P99", 0.99)]:
+                step["LATENCY_MS"][key] = latencies[max(0, int(math.ceil(quantile * len(latencies))) - 1)]
+            step["LATENCY_MS"]["MAX"] = latencies[-1]
+        # Determine the status of the step, the first anomaly found being the most significant
+        median = step["LATENCY_MS"]["P50"]
+        if step["DISCONNECTIONS"] > 0:
+            step["STATUS"] = "DISCONNECTIONS"
+        elif step["THROTTLED"] > 0:
+            step["STATUS"] = "THROTTLED"
+        elif step["ERRORS"] > 0 or step["TIMEOUTS"] > 0:
+            step["STATUS"] = "ERRORS"
+        elif baseline_median is not None and median > 3 * baseline_median and median - baseline_median > 10:
+            step["STATUS"] = "LATENCY INFLATION"
+        elif achieved_rate < 0.9 * rate:
+            step["STATUS"] = "RATE NOT REACHED"
+        else:
+            step["STATUS"] = "OK"
+        return step
+
+    def __send_messages(self, messages_list, idle_window, response_timeout, command):
         """
         Send a list of messages and store associated exchanges for later processing
 
         :param messages_list: List of messages
+        :param idle_window: Delay in seconds without any frame received after which the response of a message is considered as complete
+        :param response_timeout: Delay in seconds to wait for the first frame of the response after which the message is considered as meeting an error
+        :param command: Name of the command sending the messages (used as label of the metrics)
         """
         error_count = 0
         idx = 0
         repetition_count = len(messages_list)
         print(colored("[*] Sending messages (Exchange = Request + Response)...", "cyan", attrs=[]))
         for msg in messages_list:
-            start = time.clock()
+            start = time.perf_counter()
             try:
-                self.__check_connection_availability()
-                self.__client.send(msg)
-                response = self.__client.recv()
-                self.__exchanges[idx] = {"REQUEST": msg, "RESPONSE": response, "IS_ERROR": False}
-                print(colored("[*]    Exchange %03d successful." % idx, "cyan", attrs=[]))
+                # Discard the frames of the previous responses received after their idle window in order to not mix them with the response of this message
+                if self.__client is not None and self.__client.connected:
+                    with self.__span("recv"):
+                        self.__drain_frames(self.__client)
+                # Reopen the connection only when it is known as closed or when the sending fail because it has been closed meanwhile
+                if self.__client is None or not self.__client.connected:
+                    with self.__span("check_connection"):
+                        self.do_connect(self.__client_connection_parameters)
+                start = time.perf_counter()
+                with self.__span("send"):
+                    try:
+                        self.__client.send(msg)
+                    except (WebSocketConnectionClosedException, ConnectionError):
+                        self.do_connect(self.__client_connection_parameters)
+                        start = time.perf_counter()
+                        self.__client.send(msg)
+                with self.__span("recv"):
+                    frames, response_time = self.__receive_frames(self.__client, idle_window, response_timeout)
+                if len(frames) == 0:
+                    # Release the connection so that a late response cannot be taken as the response of the next message
+                    self.__client.shutdown()
+                    raise WebSocketTimeoutException("No response received within %s seconds" % response_timeout)
+                self.__exchanges[idx] = {"REQUEST": msg, "RESPONSE": "\n".join(frame.decode("utf-8", "replace") for frame in frames), "IS_ERROR": False,
+                                         "RESPONSE_TIME": round(response_time, 4), "FRAME_COUNT": len(frames), "RESPONSE_BYTES": sum(len(frame) for frame in frames)}
+                print(colored("[*]    Exchange %03d successful (%s frames received)." % (idx, len(frames)), "cyan", attrs=[]))
             except Exception as err:
-                self.__exchanges[idx] = {"REQUEST": msg, "RESPONSE": str(err), "IS_ERROR": True}
+                self.__exchanges[idx] = {"REQUEST": msg, "RESPONSE": str(err), "IS_ERROR": True,
+                                         "RESPONSE_TIME": round(time.perf_counter() - start, 4), "FRAME_COUNT": 0, "RESPONSE_BYTES": 0}
                 error_count += 1
                 print(colored("[!]    Exchange %03d meet error: %s" % (idx, err), "yellow", attrs=[]))
-            self.__exchanges[idx]["RESPONSE_TIME"] = round(time.clock() - start, 2)
             self.__exchanges[idx]["REQUEST_LENGTH"] = len(self.__exchanges[idx]["REQUEST"])
             self.__exchanges[idx]["RESPONSE_LENGTH"] = len(self.__exchanges[idx]["RESPONSE"])
+            self.__metrics.record_exchange(command, self.__exchanges[idx]["RESPONSE_TIME"], len(msg.encode("utf-8")),
+                                           self.__exchanges[idx]["RESPONSE_BYTES"], self.__exchanges[idx]["FRAME_COUNT"], self.__exchanges[idx]["IS_ERROR"])
             idx += 1
         print(colored("[*] %s messages sent (%s errors | %s success)." % (repetition_count, error_count, (repetition_count - error_count)), "cyan", attrs=[]))
 
-    def __check_connection_availability(self):
+    def __receive_frames(self, connection, idle_window, response_timeout, max_frames=None):
+        """
+        Receive all the data frames sent by the WS server in response to a message, the first frame being waited up to the response timeout
+        and the following ones until no frame arrive during the idle window
+
+        The socket is watched with a selector so the frames of a server that reply with several frames are not left in the socket for
+        the next exchange, and a response slower than the idle window is still received by the exchange of the message.
+        Control frames (ping/pong) are handled but do not extend the wait.
+
+        :param connection: WS connection on which the frames are received
+        :param idle_window: Delay in seconds without any frame received after the first one after which the reception is considered as complete
+        :param response_timeout: Delay in seconds to wait for the first frame (the following ones are not waited longer than this delay too)
+        :param max_frames: Number of frames after which the reception is considered as complete without waiting for the idle window (None for no limit)
+        :return: A tuple with the list of frames payloads (bytes) and the delay in seconds between the call and the reception of the last frame
+                 (or the end of the wait if no frame has been received)
+        """
+        frames = []
+        start = time.perf_counter()
+        last_frame_time = start
+        deadline = start + response_timeout
+        with selectors.DefaultSelector() as selector:
+            selector.register(connection.sock, selectors.EVENT_READ)
+            while True:
+                if len(frames) == 0:
+                    timeout = deadline - time.perf_counter()
+                else:
+                    timeout = min(last_frame_time + idle_window, deadline) - time.perf_counter()
+                if timeout <= 0:
+                    break
+                # Data already decrypted by the SSL layer are not visible to the selector
+                pending = getattr(connection.sock, "pending", None)
+                if (pending is None or pending() == 0) and len(selector.select(timeout)) == 0:
+                    break
+                opcode, data = connection.recv_data(control_frame=True)
+                if opcode == ABNF.OPCODE_CLOSE:
+                    # Connection closed by the server, release it so that it is reopened for the next message
+                    connection.shutdown()
+                    break
+                if opcode in (ABNF.OPCODE_PING, ABNF.OPCODE_PONG):
+                    continue
+                frames.append(data)
+                last_frame_time = time.perf_counter()
+                if len(frames) == 1:
+                    deadline = last_frame_time + response_timeout
+                if max_frames is not None and len(frames) >= max_frames:
+                    break
+        if len(frames) == 0:
+            return frames, time.perf_counter() - start
+        return frames, last_frame_time - start
+
+    def __drain_frames(self, connection):
+        """
+        Discard, without waiting, the frames already received on a connection so that the late or extra frames of a previous response
+        are not taken as the response of the next message
+
+        :param connection: WS connection to drain
+        :return: The number of data frames discarded
+        """
+        discarded_count = 0
+        with selectors.DefaultSelector() as selector:
+            selector.register(connection.sock, selectors.EVENT_READ)
+            while True:
+                # Data already decrypted by the SSL layer are not visible to the selector
+                pending = getattr(connection.sock, "pending", None)
+                if (pending is None or pending() == 0) and len(selector.select(0)) == 0:
+                    break
+                try:
+                    opcode, _ = connection.recv_data(control_frame=True)
+                except (WebSocketConnectionClosedException, ConnectionError):
+                    opcode = ABNF.OPCODE_CLOSE
+                if opcode == ABNF.OPCODE_CLOSE:
+                    # Connection closed by the server, release it so that it is reopened for the next message
+                    connection.shutdown()
+                    break
+                if opcode not in (ABNF.OPCODE_PING, ABNF.OPCODE_PONG):
+                    discarded_count += 1
+        return discarded_count
+
+    def __check_connection_availability(self, idle_window=0.5):
         """
         Check if connection is still opened, if not, reopen it automatically
+
+        :param idle_window: Delay in seconds without any frame received after which the response to the test message is considered as complete
         """
         print(colored("[*] Check if connection is still opened, if not, reopen it automatically...", "cyan", attrs=[]))
-        if self.__client is None:
+        if self.__client is not None and self.__client.connected:
+            try:
+                self.__drain_frames(self.__client)
+                if self.__client.connected:
+                    self.__client.send("TestAliveState")
+                    # Receive the whole response to the test message in order to not mix it with the response of the next message
+                    self.__receive_frames(self.__client, idle_window, 1)
+            except (WebSocketConnectionClosedException, ConnectionError):
+                self.__client.shutdown()
+        if self.__client is None or not self.__client.connected:
             self.do_connect(self.__client_connection_parameters)
         else:
-            try:
-                self.__client.send("TestAliveState")
-                if self.__client.recv() is not None:
-                    print(colored("[*] Connection is available.", "cyan", attrs=[]))
-            except WebSocketConnectionClosedException as wse:
-                self.do_connect(self.__client_connection_parameters)
+            print(colored("[*] Connection is available.", "cyan", attrs=[]))
 
     def __build_fuzzing_dicts(self, payload_files_list, payload_combinations, current_position):
         """
@@ -688,5 +1969,14 @@ class WSProbingShell(cmd.Cmd):
 if __name__ == "__main__":
     version = "1.0.0.dev"
     intro = ".:Welcome to the WebSocket probing shell:.\n\nVersion %s\n\nType help or ? to list commands.\n" % version
+    main_parser = argparse.ArgumentParser(description="Interactive shell in order to probe/analyze a WebSocket endpoint (commands can also be piped to the shell)")
+    main_parser.add_argument("--profile", action="store", dest="output_files_prefix", nargs="?", const="profile", default=None,
+                             help="Profile every command executed and save the profiling data to files using the specified prefix on exit (see 'help profile')")
+    main_args = main_parser.parse_args()
     colorama.init()
-    WSProbingShell().cmdloop(intro)
+    shell = WSProbingShell()
+    if main_args.output_files_prefix is not None:
+        shell.do_profile("on")
+    shell.cmdloop(intro)
+    if main_args.output_files_prefix is not None:
+        shell.do_profile("dump -f %s" % main_args.output_files_prefix)
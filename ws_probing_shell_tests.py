@@ -1,5 +1,10 @@
 import unittest
 import json
+import os
+import time
+import sqlite3
+import pstats
+from urllib.request import urlopen
 from ws_probing_shell import WSProbingShell
 
 
@@ -30,6 +35,28 @@ class TestWSShell(unittest.TestCase):
             self.assertEqual("TEST MESSAGE", data["1"]["RESPONSE"])
             self.assertFalse(data["0"]["IS_ERROR"])
             self.assertFalse(data["1"]["IS_ERROR"])
+            self.assertEqual(1, data["0"]["FRAME_COUNT"])
+            self.assertEqual(12, data["0"]["RESPONSE_BYTES"])
+
+    def test_replay_wall_time(self):
+        """
+        Test case for the REPLAY command duration, that must be bounded by the response time plus one idle window per message
+        """
+        # Run command using test material
+        instance = WSProbingShell()
+        instance.do_connect("-t ws://echo.websocket.org")
+        start = time.perf_counter()
+        instance.do_replay("-m testing_material/msg_replay.txt -n 10 -w 200")
+        elapsed = time.perf_counter() - start
+        instance.do_disconnect("")
+        instance.do_quit("")
+        # Validate the test
+        with open("exchanges_replay.json", "r") as msg_file:
+            data = json.load(msg_file)
+            self.assertEqual(len(data), 10)
+            response_times = sum(data[str(idx)]["RESPONSE_TIME"] for idx in range(10))
+            # Allow one second for the initial connection check and the storage of the exchanges
+            self.assertLess(elapsed, response_times + 10 * 0.2 + 1)
 
     def test_fuzz(self):
         """
@@ -86,6 +113,147 @@ class TestWSShell(unittest.TestCase):
             self.assertEqual(len(data), 1)
             self.assertEqual("0 1", data["test"].strip())
 
+    def test_database(self):
+        """
+        Test case for the DATABASE command with exchanges queried from a previous session
+        """
+        # Run command using test material
+        if os.path.exists("exchanges.db"):
+            os.remove("exchanges.db")
+        instance = WSProbingShell()
+        instance.do_database("-f exchanges.db")
+        instance.do_connect("-t ws://echo.websocket.org")
+        instance.do_fuzz("-m testing_material/msg_fuzzing.txt -p testing_material/payload1.txt testing_material/payload2.txt")
+        instance.do_disconnect("")
+        instance.do_quit("")
+        # Search in the run stored by the previous session
+        instance = WSProbingShell()
+        instance.do_database("-f exchanges.db")
+        instance.do_search("-r 1 -w B")
+        instance.do_quit("")
+        # Validate the test
+        with sqlite3.connect("exchanges.db") as database:
+            rows = database.execute("SELECT exchange_id, request, response, is_error FROM exchanges WHERE run_id = 1 ORDER BY exchange_id").fetchall()
+            self.assertEqual([(0, "TEST A FROM C", "TEST A FROM C", 0), (1, "TEST B FROM C", "TEST B FROM C", 0)], rows)
+        with open("exchanges_searching.json", "r") as msg_file:
+            data = json.load(msg_file)
+            self.assertEqual(len(data), 1)
+            self.assertEqual("1", data["B"].strip())
+
+    def test_database_session_runs(self):
+        """
+        Test case for the DATABASE command bound to a file after runs have been stored in memory
+        """
+        # Run command using test material
+        if os.path.exists("exchanges_session.db"):
+            os.remove("exchanges_session.db")
+        instance = WSProbingShell()
+        instance.onecmd("connect -t ws://echo.websocket.org")
+        instance.onecmd("replay -m testing_material/msg_replay.txt -n 2")
+        # Invalid arguments must not exit the shell
+        self.assertFalse(instance.onecmd("show -s latncy"))
+        instance.onecmd("database -f exchanges_session.db")
+        instance.onecmd("search -w MESSAGE")
+        instance.do_disconnect("")
+        instance.do_quit("")
+        # Validate the test
+        with sqlite3.connect("exchanges_session.db") as database:
+            rows = database.execute("SELECT run_id, command, exchange_count FROM runs").fetchall()
+            self.assertEqual([(1, "replay", 2)], rows)
+        with open("exchanges_searching.json", "r") as msg_file:
+            data = json.load(msg_file)
+            self.assertEqual("0 1", data["MESSAGE"].strip())
+
+    def test_timing(self):
+        """
+        Test case for the TIMING command
+        """
+        # Run command using test material
+        instance = WSProbingShell()
+        instance.do_connect("-t ws://echo.websocket.org")
+        instance.do_timing("-m testing_material/msg_fuzzing.txt -p testing_material/payload1.txt -n 10 -c 2")
+        instance.do_disconnect("")
+        instance.do_quit("")
+        # Validate the test
+        with open("timing_analysis.json", "r") as msg_file:
+            data = json.load(msg_file)
+            self.assertEqual(len(data), 2)
+            self.assertEqual("A", data[0]["CANDIDATE"])
+            self.assertEqual("B", data[1]["CANDIDATE"])
+            self.assertEqual(10, data[0]["SAMPLES"])
+            self.assertEqual(10, data[1]["SAMPLES"])
+            self.assertEqual(0, data[1]["ERRORS"])
+            self.assertIsNotNone(data[1]["P_VALUE"])
+
+    def test_metrics(self):
+        """
+        Test case for the METRICS command
+        """
+        # Run command using test material
+        if os.path.exists("metrics.jsonl"):
+            os.remove("metrics.jsonl")
+        instance = WSProbingShell()
+        instance.do_metrics("-p 9464 -f metrics.jsonl -i 60")
+        instance.do_connect("-t ws://echo.websocket.org")
+        instance.do_replay("-m testing_material/msg_replay.txt -n 2")
+        with urlopen("http://127.0.0.1:9464/metrics") as response:
+            exposition = response.read().decode("utf-8")
+        instance.do_disconnect("")
+        instance.do_quit("")
+        # Validate the test
+        self.assertIn('ws_probing_messages_total{command="replay"} 2', exposition)
+        self.assertIn('ws_probing_response_time_seconds_count{command="replay"} 2', exposition)
+        self.assertTrue(exposition.endswith("# EOF\n"))
+        with open("metrics.jsonl", "r") as snapshot_file:
+            snapshots = [json.loads(snapshot_line) for snapshot_line in snapshot_file]
+            self.assertEqual(2, snapshots[-1]["METRICS"]["replay"]["MESSAGES"])
+            self.assertEqual(0, snapshots[-1]["METRICS"]["replay"]["ERRORS"])
+
+    def test_profile(self):
+        """
+        Test case for the PROFILE command
+        """
+        # Run command using test material
+        instance = WSProbingShell()
+        instance.onecmd("profile on")
+        instance.onecmd("connect -t ws://echo.websocket.org")
+        instance.onecmd("replay -m testing_material/msg_replay.txt -n 2")
+        instance.onecmd("timing -m testing_material/msg_fuzzing.txt -p testing_material/payload1.txt -n 4")
+        instance.onecmd("profile off")
+        instance.onecmd("profile dump -f profile_test")
+        instance.do_disconnect("")
+        instance.do_quit("")
+        # Validate the test
+        self.assertTrue(os.path.exists("profile_test.pstats"))
+        # Functions executed by the worker threads must be profiled too
+        functions = [function[2] for function in pstats.Stats("profile_test.pstats").stats]
+        self.assertIn("__collect_timing_samples", functions)
+        with open("profile_test.collapsed", "r") as collapsed_file:
+            spans = dict(collapsed_line.rsplit(" ", 1) for collapsed_line in collapsed_file.read().splitlines())
+            self.assertIn("connect", spans)
+            self.assertIn("replay;send", spans)
+            self.assertIn("replay;recv", spans)
+            self.assertIn("replay;store", spans)
+
+    def test_probe_request_rate_limit(self):
+        """
+        Test case for the PROBE_REQUEST_RATE_LIMIT command
+        """
+        # Run command using test material
+        instance = WSProbingShell()
+        instance.do_connect("-t ws://echo.websocket.org")
+        instance.do_probe_request_rate_limit("-m testing_material/msg_replay.txt -r 1,2 -d 2")
+        instance.do_disconnect("")
+        instance.do_quit("")
+        # Validate the test
+        with open("probe_rate_limit.json", "r") as msg_file:
+            data = json.load(msg_file)
+            self.assertEqual(len(data), 2)
+            self.assertEqual(2, data[0]["SENT"])
+            self.assertEqual(4, data[1]["SENT"])
+            self.assertEqual("OK", data[0]["STATUS"])
+            self.assertIsNotNone(data[0]["LATENCY_MS"]["P50"])
+
 if __name__ == '__main__':
     unittest.main()
 